@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+代理组构建函数
+生成器中被反复调用的纯函数，保持严格的类型标注以便用 mypyc 编译:
+    cd src && mypyc _group_builders.py
+编译得到的扩展模块与本文件同名，存在时会被优先导入，否则使用本文件
+"""
+
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+# 各代理组类型需要附加的参数
+GROUP_TYPE_EXTRAS: Dict[str, Dict[str, Any]] = {
+    "fallback": {"timeout": 5000, "interval": 600},
+    "url-test": {"tolerance": 500, "interval": 600},
+    "load-balance": {"strategy": "consistent-hashing", "interval": 600},
+}
+
+# 关键词按字面匹配，转义其中的正则元字符（空格等普通字符保持原样）
+_REGEX_ESCAPE_TABLE = str.maketrans({c: "\\" + c for c in "\\.^$*+?()[]{}|"})
+
+# (地区名称, 地区组名称前缀, 不含 name/use 差异的代理组模板)
+RegionMeta = Tuple[str, str, Dict[str, Any]]
+
+
+def keywords_pattern(keywords: Iterable[str]) -> str:
+    """将关键词列表转义后用 | 连接为正则片段"""
+    return "|".join(k.translate(_REGEX_ESCAPE_TABLE) for k in keywords)
+
+
+def wrap_filter_regex(keyword_pattern: str, exclude_pattern: Optional[str]) -> str:
+    """为关键词正则加上排除关键词的负向前瞻"""
+    # 格式: (?!.*(关键词1|关键词2|...)).*地区关键词
+    if exclude_pattern:
+        return f"(?!.*({exclude_pattern})).*({keyword_pattern})"
+    return keyword_pattern
+
+
+def create_proxy_group_config(
+    name: str,
+    group_type: str,
+    filter_regex: str,
+    test_url: str,
+    use_providers: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """创建代理组配置的通用方法"""
+    group_config: Dict[str, Any] = {
+        "name": name,
+        "type": group_type,
+        "filter": filter_regex,
+        "url": test_url,
+    }
+
+    # 根据类型添加特定参数
+    extras = GROUP_TYPE_EXTRAS.get(group_type)
+    if extras:
+        group_config.update(extras)
+
+    # 如果有提供者列表，则添加use字段
+    if use_providers:
+        group_config["use"] = use_providers
+
+    return group_config
+
+
+def build_provider_region_groups(
+    provider_names: Iterable[str],
+    region_meta: List[RegionMeta],
+    region_providers_map: Dict[str, FrozenSet[str]],
+) -> List[Dict[str, Any]]:
+    """按 提供者 × 地区 生成代理组"""
+    groups: List[Dict[str, Any]] = []
+    for provider_name in provider_names:
+        for region_name, region_prefix, template in region_meta:
+            # 如果region_providers有配置，只生成配置中包含此提供者的地区
+            # 如果region_providers没有配置此地区，则生成所有地区
+            allowed_providers = region_providers_map.get(region_name)
+            if allowed_providers is not None and provider_name not in allowed_providers:
+                continue
+
+            group_config = template.copy()
+            group_config["name"] = region_prefix + "_" + provider_name
+            group_config["use"] = [provider_name]
+            groups.append(group_config)
+    return groups
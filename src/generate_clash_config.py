@@ -6,28 +6,250 @@ Clash 配置生成器 - 服务器版本
 """
 
 import os
+import re
 import sys
 import yaml
+import atexit
+import functools
+import itertools
+import json
+import queue
+import stat
+import tempfile
 import configparser
 import logging
+import logging.handlers
+from dataclasses import dataclass
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Mapping, Optional, FrozenSet, Tuple, TypedDict
+
+from _group_builders import (
+    RegionMeta,
+    build_provider_region_groups,
+    create_proxy_group_config,
+    keywords_pattern,
+    wrap_filter_regex,
+)
 
 # 确保日志目录存在
 Path("logs").mkdir(parents=True, exist_ok=True)
 
 # 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("logs/clash_generator.log", encoding="utf-8"),
-        logging.StreamHandler(),
-    ],
-)
+# 日志先放入队列，由后台线程写入文件和控制台，生成过程不会被磁盘写入阻塞
+_log_formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+_log_handlers = [
+    logging.FileHandler("logs/clash_generator.log", encoding="utf-8", delay=True),
+    logging.StreamHandler(),
+]
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
+
+_log_queue = queue.Queue(-1)
+_log_listener = logging.handlers.QueueListener(_log_queue, *_log_handlers)
+_log_listener.start()
+# 进程退出前停止后台线程，确保队列中的日志全部写出
+atexit.register(_log_listener.stop)
+
+_queue_handler = logging.handlers.QueueHandler(_log_queue)
+# 队列中只保留消息本身，时间和级别由实际输出的 handler 格式化
+_queue_handler.setFormatter(logging.Formatter("%(message)s"))
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
 logger = logging.getLogger(__name__)
 
+# 优先使用 libyaml 提供的 C 加速解析器/输出器，不可用时回退到纯 Python 实现
+Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+Dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
+def _yaml_dump(config: Mapping[str, Any]) -> str:
+    """使用 PyYAML 输出配置文本"""
+    # libyaml 即使指定了 allow_unicode，也会把 U+FFFF 以上的字符（如国旗 emoji）
+    # 输出为 \UXXXXXXXX 转义，这是合法的 YAML，解析结果不变，因此保持原样
+    return yaml.dump(
+        config,
+        Dumper=Dumper,
+        default_flow_style=False,
+        allow_unicode=True,
+        sort_keys=False,
+    )
+
+
+# 可以作为普通（plain）标量输出的字符串：不以 YAML 指示符开头，不含控制字符、
+# 换行以及 YAML 不允许原样出现的字符
+_PLAIN_SCALAR_RE = re.compile(
+    "[^\\s\\-?:,\\[\\]{}#&*!|>'\"%@`"
+    "\\x00-\\x1f\\x7f-\\x9f\\u2028\\u2029\\ufeff\\ufffe\\uffff\\ud800-\\udfff]"
+    "[^\\x00-\\x1f\\x7f-\\x9f\\u2028\\u2029\\ufeff\\ufffe\\uffff\\ud800-\\udfff]*"
+)
+# 不能原样出现在双引号标量中、json.dumps 又不会转义的字符
+_UNSAFE_QUOTED_RE = re.compile(
+    "[\\x7f-\\x9f\\u2028\\u2029\\ufeff\\ufffe\\uffff\\ud800-\\udfff]"
+)
+_yaml_resolver = yaml.resolver.Resolver()
+
+
+class _UnsupportedYaml(Exception):
+    """配置中出现快速输出不支持的内容，需要回退到 yaml.dump"""
+
+
+@functools.lru_cache(maxsize=None)
+def _yaml_str(value: str) -> str:
+    """将字符串格式化为 YAML 标量，能作为普通标量时不加引号"""
+    if (
+        _PLAIN_SCALAR_RE.fullmatch(value)
+        and not value.endswith((" ", ":"))
+        and ": " not in value
+        and " #" not in value
+        and not value.startswith("...")
+        # 会被解析为布尔值、数字、null 等类型的字符串必须加引号
+        and _yaml_resolver.resolve(yaml.ScalarNode, value, (True, False))
+        == "tag:yaml.org,2002:str"
+    ):
+        return value
+    if _UNSAFE_QUOTED_RE.search(value):
+        raise _UnsupportedYaml(value)
+    # JSON 字符串同时也是合法的 YAML 双引号标量
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _yaml_inline_value(value: Any) -> str:
+    """格式化可以写在同一行的值：标量和空集合"""
+    if isinstance(value, str):
+        return _yaml_str(value)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value)
+    if value is None:
+        return "null"
+    if value == {}:
+        return "{}"
+    if value == []:
+        return "[]"
+    raise _UnsupportedYaml(type(value).__name__)
+
+
+def _emit_yaml_mapping(mapping: Mapping[str, Any], indent: int, lines: List[str]):
+    """按块格式输出映射，子列表不额外缩进（与 PyYAML 默认格式一致）"""
+    pad = " " * indent
+    for key, value in mapping.items():
+        if not isinstance(key, str):
+            raise _UnsupportedYaml(repr(key))
+        key_text = _yaml_str(key)
+        if len(key_text) > 128:
+            # 过长的键需要使用显式键语法
+            raise _UnsupportedYaml(key)
+
+        if isinstance(value, dict) and value:
+            lines.append(f"{pad}{key_text}:")
+            _emit_yaml_mapping(value, indent + 2, lines)
+        elif isinstance(value, list) and value:
+            lines.append(f"{pad}{key_text}:")
+            _emit_yaml_sequence(value, indent, lines)
+        else:
+            lines.append(f"{pad}{key_text}: {_yaml_inline_value(value)}")
+
+
+def _emit_yaml_sequence(items: List[Any], indent: int, lines: List[str]):
+    """按块格式输出列表"""
+    pad = " " * indent
+    for item in items:
+        if isinstance(item, (dict, list)) and item:
+            start = len(lines)
+            if isinstance(item, dict):
+                _emit_yaml_mapping(item, indent + 2, lines)
+            else:
+                _emit_yaml_sequence(item, indent + 2, lines)
+            # 第一行的缩进位置换成 "- "
+            lines[start] = f"{pad}- {lines[start][indent + 2:]}"
+        else:
+            lines.append(f"{pad}- {_yaml_inline_value(item)}")
+
+
+def _fast_yaml_dump(config: Mapping[str, Any]) -> Optional[str]:
+    """按 Clash 配置的结构直接拼接 YAML 文本，遇到不支持的内容时返回 None"""
+    if not config:
+        return None
+
+    lines: List[str] = []
+    try:
+        _emit_yaml_mapping(config, 0, lines)
+    except _UnsupportedYaml:
+        return None
+    lines.append("")
+    return "\n".join(lines)
+
+
+def _to_bool(value: str) -> bool:
+    """按 ConfigParser.getboolean 的规则转换布尔值"""
+    try:
+        return configparser.RawConfigParser.BOOLEAN_STATES[value.lower()]
+    except KeyError:
+        raise ValueError(f"Not a boolean: {value}")
+
+
+def _output_file_mode(path: str) -> int:
+    """新配置文件使用的权限：沿用已有文件的权限，否则与 open() 新建文件一致"""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        # 只能通过设置再恢复的方式读取 umask
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def _file_content_equals(path: str, payload: bytes) -> bool:
+    """判断文件现有内容是否与 payload 完全相同，文件不存在时返回 False"""
+    try:
+        # 大小不同时无需读取内容
+        if os.stat(path).st_size != len(payload):
+            return False
+        with open(path, "rb") as f:
+            return f.read() == payload
+    except OSError:
+        return False
+
+
+# generate_config 生成的完整 Clash 配置，键名中含有 "-"，使用函数式写法
+ClashConfig = TypedDict(
+    "ClashConfig",
+    {
+        "port": int,
+        "socks-port": int,
+        "allow-lan": bool,
+        "mode": str,
+        "log-level": str,
+        "external-controller": str,
+        "proxy-providers": Dict[str, Any],
+        "proxy-groups": List[Dict[str, Any]],
+        "rule-providers": Dict[str, Any],
+        "rules": List[str],
+    },
+)
+
+
+@dataclass(frozen=True)
+class ClashSettings:
+    """config.ini 解析后的配置（在 load_config 中一次性构建）"""
+
+    # (提供者名称, 订阅URL)，名称已转为大写
+    providers: Tuple[Tuple[str, str], ...]
+    # 地区名称 -> (emoji, 关键词)
+    regions: Dict[str, Tuple[str, Tuple[str, ...]]]
+    exclude_keywords: Tuple[str, ...]
+    test_url: str
+    # 未单独配置类型时的默认类型: {"auto": ..., "merged": ...}
+    default_types: Dict[str, str]
+    # group_type_<地区> = 类型
+    group_type_by_region: Dict[str, str]
+    use_merged_groups: bool
+    # [region_providers] 中为各地区配置的提供者（保持配置顺序）
+    region_providers: Dict[str, Tuple[str, ...]]
+    # [custom_groups] 原始配置字符串，由 generate_custom_groups 解析
+    custom_groups_raw: Dict[str, str]
+
 
 class ClashConfigGenerator:
     def __init__(self, config_file="config/config.ini"):
@@ -35,34 +257,136 @@ class ClashConfigGenerator:
         # 创建 ConfigParser 并保留键名的大小写
         self.config = configparser.RawConfigParser()
         self.config.optionxform = str  # 保留键名原始大小写
+        self.sections: Dict[str, Dict[str, str]] = {}
         self.rules_config = {}
         self.load_config()
 
         # 从配置文件获取规则文件路径
-        self.rules_file = self.config.get(
-            "files", "rules_config", fallback="config/rules.yaml"
+        self.rules_file = self._get_option(
+            "files", "rules_config", "config/rules.yaml"
         )
         self.load_rules_config()
 
     def load_config(self):
         """加载配置文件"""
-        if not Path(self.config_file).exists():
+        try:
+            # ConfigParser.read 会忽略不存在的文件，这里直接打开以便报错
+            with open(self.config_file, "r", encoding="utf-8") as f:
+                self.config.read_file(f)
+            # 每个 section 只读取一次，生成过程中直接使用普通 dict
+            self.sections = {
+                name: dict(self.config[name]) for name in self.config.sections()
+            }
+        except FileNotFoundError:
             logger.error(f"配置文件 {self.config_file} 不存在")
             sys.exit(1)
 
-        self.config.read(self.config_file, encoding="utf-8")
+        self.settings = self._build_settings()
+        self._build_region_caches()
+
+        # 代理提供者和地区配置在生成过程中不再变化，只构造一次
+        self._proxy_providers: Dict[str, str] = dict(self.settings.providers)
+        self._regions: Dict[str, Dict[str, Any]] = {
+            region: {"emoji": emoji, "keywords": list(keywords)}
+            for region, (emoji, keywords) in self.settings.regions.items()
+        }
         logger.info(f"已加载配置文件: {self.config_file}")
 
+    def _get_option(self, section: str, option: str, fallback: Any = None) -> Any:
+        """读取配置项，section 或配置项不存在时返回 fallback"""
+        return self.sections.get(section, {}).get(option, fallback)
+
+    def _get_bool_option(self, section: str, option: str, fallback: bool) -> bool:
+        """读取布尔配置项"""
+        value = self._get_option(section, option)
+        return fallback if value is None else _to_bool(value)
+
+    def _build_settings(self) -> ClashSettings:
+        """将配置文件解析为 ClashSettings，后续生成过程不再访问 ConfigParser"""
+        sections = self.sections
+
+        providers = {}
+        for name, url in sections.get("proxy_providers", {}).items():
+            providers[name.upper()] = url
+
+        regions = {}
+        for region, config_str in sections.get("regions", {}).items():
+            parts = [k.strip() for k in config_str.split(",")]
+            if len(parts) >= 2:
+                # 第一个是 emoji，其余是关键词
+                regions[region] = (parts[0], tuple(parts[1:]))
+
+        exclude_keywords = ()
+        keywords_str = self._get_option("filter", "exclude_keywords", "")
+        if keywords_str:
+            exclude_keywords = tuple(k.strip() for k in keywords_str.split(","))
+
+        # 各地区自定义的代理组类型: group_type_<地区> = 类型
+        group_type_by_region = {}
+        prefix = "group_type_"
+        for key, value in sections.get("clash", {}).items():
+            if key.startswith(prefix):
+                group_type_by_region[key[len(prefix):]] = value
+
+        region_providers = {}
+        for region_name, providers_str in sections.get("region_providers", {}).items():
+            region_providers[region_name] = tuple(
+                p.strip() for p in providers_str.split(",")
+            )
+
+        return ClashSettings(
+            providers=tuple(providers.items()),
+            regions=regions,
+            exclude_keywords=exclude_keywords,
+            test_url=self._get_option(
+                "clash",
+                "test_url",
+                "http://connectivitycheck.gstatic.com/generate_204",
+            ),
+            default_types={
+                "auto": self._get_option("clash", "default_group_type", "url-test"),
+                "merged": self._get_option("clash", "default_group_type", "fallback"),
+            },
+            group_type_by_region=group_type_by_region,
+            use_merged_groups=self._get_bool_option(
+                "clash", "use_merged_region_groups", False
+            ),
+            region_providers=region_providers,
+            custom_groups_raw=dict(sections.get("custom_groups", {})),
+        )
+
+    def _build_region_caches(self):
+        """预先生成排除关键词的正则片段"""
+        self._exclude_fragment: Optional[str] = (
+            keywords_pattern(self.settings.exclude_keywords) or None
+        )
+
+    @staticmethod
+    def _get_region_prefixes(regions: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+        """地区组名称前缀（emoji + 地区名），会被多处用作代理组名称"""
+        return {
+            region_name: f"{region_config['emoji']}{region_name}"
+            for region_name, region_config in regions.items()
+        }
+
+    def _wrap_filter_regex(self, keyword_pattern: str) -> str:
+        """为关键词正则加上排除关键词的负向前瞻"""
+        return wrap_filter_regex(keyword_pattern, self._exclude_fragment)
+
     def load_rules_config(self):
         """加载规则配置文件"""
-        if not Path(self.rules_file).exists():
-            logger.error(f"规则配置文件 {self.rules_file} 不存在")
-            sys.exit(1)
-
         try:
-            with open(self.rules_file, "r", encoding="utf-8") as f:
-                self.rules_config = yaml.safe_load(f)
+            # 以二进制方式读取，由 libyaml 直接解码 UTF-8
+            with open(self.rules_file, "rb") as f:
+                self.rules_config = yaml.load(f, Loader=Loader)
+            self._rule_providers: Dict[str, Any] = self.rules_config.get(
+                "rule-providers", {}
+            )
+            self._custom_rules: List[str] = self._build_custom_rules()
             logger.info(f"已加载规则配置文件: {self.rules_file}")
+        except FileNotFoundError:
+            logger.error(f"规则配置文件 {self.rules_file} 不存在")
+            sys.exit(1)
         except yaml.YAMLError as e:
             logger.error(f"规则配置文件格式错误: {e}")
             sys.exit(1)
@@ -71,45 +395,23 @@ class ClashConfigGenerator:
             sys.exit(1)
 
     def get_proxy_providers(self) -> Dict[str, str]:
-        """获取代理提供者配置"""
-        providers = {}
-        if "proxy_providers" in self.config:
-            for name, url in self.config["proxy_providers"].items():
-                providers[name.upper()] = url
-        return providers
+        """获取代理提供者配置（加载配置时已构造，返回其浅拷贝）"""
+        return dict(self._proxy_providers)
 
     def get_regions(self) -> Dict[str, Dict[str, Any]]:
-        """获取地区配置"""
-        regions = {}
-        if "regions" in self.config:
-            for region, config_str in self.config["regions"].items():
-                parts = [k.strip() for k in config_str.split(",")]
-                if len(parts) >= 2:
-                    # 第一个是 emoji，其余是关键词
-                    emoji = parts[0]
-                    keywords = parts[1:]
-                    regions[region] = {"emoji": emoji, "keywords": keywords}
-        return regions
+        """获取地区配置（加载配置时已构造，返回其浅拷贝）"""
+        return dict(self._regions)
 
     def get_exclude_keywords(self) -> List[str]:
         """获取要排除的节点关键词"""
-        exclude_keywords = []
-        if "filter" in self.config:
-            keywords_str = self.config.get("filter", "exclude_keywords", fallback="")
-            if keywords_str:
-                exclude_keywords = [k.strip() for k in keywords_str.split(",")]
-        return exclude_keywords
+        return list(self.settings.exclude_keywords)
 
     def generate_proxy_providers_config(
         self, providers: Dict[str, str]
     ) -> Dict[str, Any]:
         """生成 proxy-providers 配置"""
         proxy_providers = {}
-        test_url = self.config.get(
-            "clash",
-            "test_url",
-            fallback="http://connectivitycheck.gstatic.com/generate_204",
-        )
+        test_url = self.settings.test_url
 
         for name, url in providers.items():
             proxy_providers[name] = {
@@ -122,105 +424,56 @@ class ClashConfigGenerator:
 
         return proxy_providers
 
-    def _create_proxy_group_config(self, name: str, group_type: str, use_providers: List[str], filter_regex: str, test_url: str) -> Dict[str, Any]:
-        """创建代理组配置的通用方法"""
-        group_config = {
-            "name": name,
-            "type": group_type,
-            "filter": filter_regex,
-            "url": test_url,
-        }
-
-        # 根据类型添加特定参数
-        if group_type == "fallback":
-            group_config["timeout"] = 5000
-            group_config["interval"] = 600
-        elif group_type == "url-test":
-            group_config["tolerance"] = 500
-            group_config["interval"] = 600
-        elif group_type == "load-balance":
-            group_config["strategy"] = "consistent-hashing"
-            group_config["interval"] = 600
-
-        # 如果有提供者列表，则添加use字段
-        if use_providers:
-            group_config["use"] = use_providers
-
-        return group_config
-
     def generate_auto_groups(
         self, providers: Dict[str, str], regions: Dict[str, Dict[str, Any]]
     ) -> List[Dict[str, Any]]:
         """生成自动选择组（跳过可能为空的组）"""
-        auto_groups = []
-        test_url = self.config.get(
-            "clash",
-            "test_url",
-            fallback="http://connectivitycheck.gstatic.com/generate_204",
-        )
-
-        # 获取排除关键词
-        exclude_keywords = self.get_exclude_keywords()
+        test_url = self.settings.test_url
 
         # 获取默认类型
-        default_type = self.config.get(
-            "clash", "default_group_type", fallback="url-test"
-        )
+        default_type = self.settings.default_types["auto"]
 
         # 使用region_providers配置来决定为哪些提供者生成哪些地区的组
         region_providers_map = self._get_region_providers_config(providers)
 
-        for provider_name in providers.keys():
-            for region_name, region_config in regions.items():
-                # 检查是否应该为此提供者生成此地区的组
-                # 如果region_providers有配置，只生成配置中包含此提供者的地区
-                # 如果region_providers没有配置此地区，则生成所有地区
-                if region_name in region_providers_map and provider_name not in region_providers_map[region_name]:
-                    logger.debug(
-                        f"跳过 {provider_name} 的 {region_name} 组（未在region_providers中配置）"
-                    )
-                    continue
+        # 预先计算每个地区与提供者无关的部分：名称前缀和代理组模板（含过滤正则）
+        # 没有关键词的地区无法生成过滤器，直接跳过
+        region_meta: List[RegionMeta] = []
+        for region_name, region_config in regions.items():
+            if not region_config["keywords"]:
+                continue
 
-                emoji = region_config["emoji"]
-                keywords = region_config["keywords"]
+            # 检查该地区是否有自定义类型
+            group_type = self.settings.group_type_by_region.get(region_name, default_type)
 
-                # 检查该地区是否有自定义类型
-                group_type = self.config.get(
-                    "clash", f"group_type_{region_name}", fallback=default_type
-                )
+            # 使用 | 连接所有关键词，创建正则表达式
+            # 例如: "Hong Kong|HK|港" 可以匹配包含任意一个关键词的节点名称
+            # 如果有排除关键词，使用负向前瞻断言排除包含这些关键词的节点
+            filter_regex = self._wrap_filter_regex(
+                keywords_pattern(region_config["keywords"])
+            )
 
-                # 将所有关键词组合成正则表达式，支持多关键词匹配
-                if keywords:
-                    # 使用 | 连接所有关键词，创建正则表达式
-                    # 例如: "Hong Kong|HK|港" 可以匹配包含任意一个关键词的节点名称
-                    filter_regex = "|".join(keywords)
-
-                    # 如果有排除关键词，使用负向前瞻断言排除包含这些关键词的节点
-                    # 格式: (?!.*(关键词1|关键词2|...)).*地区关键词
-                    if exclude_keywords:
-                        exclude_pattern = "|".join(exclude_keywords)
-                        # 负向前瞻：排除包含排除关键词的节点
-                        filter_regex = f"(?!.*({exclude_pattern})).*({filter_regex})"
-
-                    group_name = f"{emoji}{region_name}_{provider_name}"
-
-                    # 创建代理组配置
-                    group_config = self._create_proxy_group_config(
-                        name=group_name,
-                        group_type=group_type,  # 使用配置的类型而不是固定的url-test
-                        use_providers=[provider_name],
-                        filter_regex=filter_regex,
-                        test_url=test_url
-                    )
-
-                    # 注意：Clash 会自动处理空的代理组
-                    # 如果 filter 没有匹配到任何节点，该组在 Clash 中会显示为空
-                    # 但不会影响配置的正常运行
-
-                    auto_groups.append(group_config)
-                    logger.debug(
-                        f"创建自动选择组: {group_name} (类型: {group_type}, 过滤器: {filter_regex})"
-                    )
+            # 模板不含 use 字段，name 在生成时按提供者覆盖
+            region_prefix = f"{region_config['emoji']}{region_name}"
+            template = create_proxy_group_config(
+                name=region_prefix,
+                group_type=group_type,  # 使用配置的类型而不是固定的url-test
+                filter_regex=filter_regex,
+                test_url=test_url
+            )
+            region_meta.append((region_name, region_prefix, template))
+
+        # 注意：Clash 会自动处理空的代理组
+        # 如果 filter 没有匹配到任何节点，该组在 Clash 中会显示为空
+        # 但不会影响配置的正常运行
+        auto_groups = build_provider_region_groups(
+            providers, region_meta, region_providers_map
+        )
+        if logger.isEnabledFor(logging.DEBUG):
+            for group_config in auto_groups:
+                logger.debug(
+                    f"创建自动选择组: {group_config['name']} (类型: {group_config['type']}, 过滤器: {group_config['filter']})"
+                )
 
         logger.info(f"生成了 {len(auto_groups)} 个自动选择组")
         return auto_groups
@@ -230,36 +483,21 @@ class ClashConfigGenerator:
     ) -> List[Dict[str, Any]]:
         """生成合并的地区组（指定提供者的节点合并到一个地区组）"""
         merged_groups = []
-        test_url = self.config.get(
-            "clash",
-            "test_url",
-            fallback="http://connectivitycheck.gstatic.com/generate_204",
-        )
-
-        # 获取排除关键词
-        exclude_keywords = self.get_exclude_keywords()
+        test_url = self.settings.test_url
 
         # 获取默认类型
-        default_type = self.config.get(
-            "clash", "default_group_type", fallback="fallback"
-        )
+        default_type = self.settings.default_types["merged"]
 
         # 获取地区特定提供者配置
-        region_providers_config = {}
-        if self.config.has_section("region_providers"):
-            for region_name, providers_str in self.config["region_providers"].items():
-                provider_list = [p.strip() for p in providers_str.split(",")]
-                region_providers_config[region_name] = provider_list
-                logger.info(f"地区 {region_name} 配置的提供者: {provider_list}")
+        region_providers_config = self.settings.region_providers
+        for region_name, provider_list in region_providers_config.items():
+            logger.info(f"地区 {region_name} 配置的提供者: {list(provider_list)}")
 
         for region_name, region_config in regions.items():
-            emoji = region_config["emoji"]
             keywords = region_config["keywords"]
 
             # 检查该地区是否有自定义类型
-            group_type = self.config.get(
-                "clash", f"group_type_{region_name}", fallback=default_type
-            )
+            group_type = self.settings.group_type_by_region.get(region_name, default_type)
 
             # 检查该地区是否有指定的提供者
             if region_name in region_providers_config:
@@ -273,19 +511,16 @@ class ClashConfigGenerator:
                     continue
             else:
                 # 默认使用所有提供者
-                selected_providers = list(providers.keys())
+                selected_providers = list(providers)
 
             # 生成过滤正则
             if keywords:
-                filter_regex = "|".join(keywords)
-                if exclude_keywords:
-                    exclude_pattern = "|".join(exclude_keywords)
-                    filter_regex = f"(?!.*({exclude_pattern})).*({filter_regex})"
+                filter_regex = self._wrap_filter_regex(keywords_pattern(keywords))
 
-            group_name = f"{emoji}{region_name}"
+            group_name = f"{region_config['emoji']}{region_name}"
 
             # 创建合并的代理组配置（使用选中的提供者，通过 filter 筛选节点）
-            group_config = self._create_proxy_group_config(
+            group_config = create_proxy_group_config(
                 name=group_name,
                 group_type=group_type,
                 use_providers=selected_providers,  # 使用选中的提供者
@@ -299,48 +534,20 @@ class ClashConfigGenerator:
         logger.info(f"生成了 {len(merged_groups)} 个合并地区组")
         return merged_groups
 
-    def _create_custom_proxy_group_config(self, name: str, group_type: str, filter_regex: str, test_url: str) -> Dict[str, Any]:
-        """创建自定义代理组配置的通用方法"""
-        group_config = {
-            "name": name,
-            "type": group_type,
-            "filter": filter_regex,
-            "url": test_url,
-        }
-
-        # 根据类型添加特定参数
-        if group_type == "fallback":
-            group_config["timeout"] = 5000
-            group_config["interval"] = 600
-        elif group_type == "url-test":
-            group_config["tolerance"] = 500
-            group_config["interval"] = 600
-        elif group_type == "load-balance":
-            group_config["strategy"] = "consistent-hashing"
-            group_config["interval"] = 600
-
-        return group_config
-
     def generate_custom_groups(
         self, providers: Dict[str, str], regions: Dict[str, Dict[str, Any]]
-    ) -> List[Dict[str, Any]]:
-        """生成自定义节点组"""
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, List[str]]]:
+        """生成自定义节点组，同时返回各组的目标代理组（组名 -> 目标组列表）"""
         custom_groups = []
+        target_groups_by_name: Dict[str, List[str]] = {}
 
-        if not self.config.has_section("custom_groups"):
-            return custom_groups
+        if not self.settings.custom_groups_raw:
+            return custom_groups, target_groups_by_name
 
-        test_url = self.config.get(
-            "clash",
-            "test_url",
-            fallback="http://connectivitycheck.gstatic.com/generate_204",
-        )
-
-        # 获取排除关键词
-        exclude_keywords = self.get_exclude_keywords()
+        test_url = self.settings.test_url
 
         # 遍历所有自定义组配置
-        for group_name, config_str in self.config["custom_groups"].items():
+        for group_name, config_str in self.settings.custom_groups_raw.items():
             try:
                 # 解析配置: emoji, 类型, 提供者列表, 地区列表, 目标代理组列表
                 parts = [p.strip() for p in config_str.split(",")]
@@ -377,44 +584,42 @@ class ClashConfigGenerator:
                 # 解析地区列表并生成过滤正则
                 if regions_str:
                     selected_regions = [r.strip() for r in regions_str.split("|")]
-                    # 收集所有选中地区的关键词
-                    all_keywords = []
-                    for region_name in selected_regions:
-                        if region_name in regions:
-                            all_keywords.extend(regions[region_name]["keywords"])
+                    # 收集所有选中地区的关键词正则片段
+                    region_fragments = [
+                        keywords_pattern(regions[region_name]["keywords"])
+                        for region_name in selected_regions
+                        if region_name in regions
+                    ]
 
-                    if not all_keywords:
+                    if not region_fragments:
                         logger.warning(
                             f"自定义组 {group_name} 没有有效的地区关键词，跳过"
                         )
                         continue
 
                     # 生成过滤正则
-                    filter_regex = "|".join(all_keywords)
-                    if exclude_keywords:
-                        exclude_pattern = "|".join(exclude_keywords)
-                        filter_regex = f"(?!.*({exclude_pattern})).*({filter_regex})"
+                    filter_regex = self._wrap_filter_regex("|".join(region_fragments))
                 else:
                     logger.warning(f"自定义组 {group_name} 没有指定地区，跳过")
                     continue
 
                 # 创建自定义组配置
                 full_group_name = f"{emoji}{group_name}"
-                group_config = self._create_custom_proxy_group_config(
+                # use 参数：如果指定了提供者则使用指定的，否则使用所有提供者
+                group_config = create_proxy_group_config(
                     name=full_group_name,
                     group_type=group_type,
                     filter_regex=filter_regex,
-                    test_url=test_url
+                    test_url=test_url,
+                    use_providers=(
+                        selected_providers
+                        if has_specific_providers
+                        else list(providers)
+                    ),
                 )
 
-                # 添加 use 参数：如果指定了提供者则使用指定的，否则使用所有提供者
-                if has_specific_providers:
-                    group_config["use"] = selected_providers
-                else:
-                    group_config["use"] = list(providers.keys())
-
                 # 保存目标代理组信息（用于后续添加到主代理组）
-                group_config["_target_groups"] = target_groups
+                target_groups_by_name[full_group_name] = target_groups
 
                 custom_groups.append(group_config)
                 provider_info = (
@@ -440,21 +645,21 @@ class ClashConfigGenerator:
         if custom_groups:
             logger.info(f"生成了 {len(custom_groups)} 个自定义节点组")
 
-        return custom_groups
+        return custom_groups, target_groups_by_name
 
     def generate_manual_select_group(
         self, providers: Dict[str, str]
     ) -> Optional[Dict[str, Any]]:
         """生成手动选择组"""
-        if not self.config.has_section("manual_select"):
+        if "manual_select" not in self.sections:
             return None
 
-        enabled = self.config.getboolean("manual_select", "enabled", fallback=False)
+        enabled = self._get_bool_option("manual_select", "enabled", False)
         if not enabled:
             return None
 
-        name = self.config.get("manual_select", "name", fallback="手动选择")
-        emoji = self.config.get("manual_select", "emoji", fallback="✋")
+        name = self._get_option("manual_select", "name", "手动选择")
+        emoji = self._get_option("manual_select", "emoji", "✋")
 
         full_group_name = f"{emoji}{name}"
 
@@ -462,49 +667,44 @@ class ClashConfigGenerator:
         group_config = {
             "name": full_group_name,
             "type": "select",
-            "use": list(providers.keys()),  # 使用所有代理提供者
+            "use": list(providers),  # 使用所有代理提供者
         }
 
         logger.info(f"创建手动选择组: {full_group_name}")
         return group_config
 
-    def _get_region_providers_config(self, providers: Dict[str, str]) -> Dict[str, Any]:
-        """获取region_providers配置映射"""
+    def _get_region_providers_config(
+        self, providers: Dict[str, str]
+    ) -> Dict[str, FrozenSet[str]]:
+        """获取region_providers配置映射（地区 -> 可用的提供者集合）"""
         region_providers_config = {}
-        if self.config.has_section("region_providers"):
-            for region_name, providers_str in self.config["region_providers"].items():
-                provider_list = [p.strip() for p in providers_str.split(",")]
-                for provider_name in providers.keys():
-                    if provider_name in provider_list:
-                        if region_name not in region_providers_config:
-                            region_providers_config[region_name] = []
-                        region_providers_config[region_name].append(provider_name)
+        for region_name, provider_list in self.settings.region_providers.items():
+            provider_set = frozenset(provider_list)
+            matched = frozenset(p for p in providers if p in provider_set)
+            if matched:
+                region_providers_config[region_name] = matched
+
         return region_providers_config
 
     def _get_region_group_names(self, providers: Dict[str, str], regions: Dict[str, Dict[str, Any]], use_merged_groups: bool) -> List[str]:
         """获取所有地区组名称"""
         region_group_names = []
+        region_prefixes = self._get_region_prefixes(regions)
         if use_merged_groups:
-            for region_name, region_config in regions.items():
-                emoji = region_config["emoji"]
-                region_group_names.append(f"{emoji}{region_name}")
+            for region_name in regions:
+                region_group_names.append(region_prefixes[region_name])
         else:
             # 使用region_providers配置来决定包含哪些地区组
             region_providers_map = self._get_region_providers_config(providers)
             
             for provider_name in providers.keys():
-                for region_name, region_config in regions.items():
+                for region_name in regions:
                     # 检查该提供者是否在region_providers配置中被指定用于此地区
-                    if region_name in region_providers_map and provider_name in region_providers_map[region_name]:
-                        emoji = region_config["emoji"]
-                        region_group_names.append(
-                            f"{emoji}{region_name}_{provider_name}"
-                        )
                     # 如果没有region_providers配置，或者该地区没有配置，则包含所有地区
-                    elif region_name not in region_providers_map:
-                        emoji = region_config["emoji"]
+                    allowed_providers = region_providers_map.get(region_name)
+                    if allowed_providers is None or provider_name in allowed_providers:
                         region_group_names.append(
-                            f"{emoji}{region_name}_{provider_name}"
+                            region_prefixes[region_name] + "_" + provider_name
                         )
         return region_group_names
 
@@ -515,54 +715,46 @@ class ClashConfigGenerator:
         relay_groups = []
         
         # 检查是否有中继组配置
-        if not self.config.has_section("relay_groups"):
+        if "relay_groups" not in self.sections:
             return relay_groups
 
-        test_url = self.config.get(
-            "clash",
-            "test_url",
-            fallback="http://connectivitycheck.gstatic.com/generate_204",
-        )
+        test_url = self.settings.test_url
 
         # 获取中继组配置
-        relay_name = self.config.get("relay_groups", "name", fallback="统一代理")
-        relay_type = self.config.get("relay_groups", "type", fallback="fallback")
+        relay_name = self._get_option("relay_groups", "name", "统一代理")
+        relay_type = self._get_option("relay_groups", "type", "fallback")
         
         # 获取要包含的地区列表，如果未指定则包含所有地区
-        included_regions_str = self.config.get("relay_groups", "regions", fallback="")
+        included_regions_str = self._get_option("relay_groups", "regions", "")
         if included_regions_str:
             included_regions = [r.strip() for r in included_regions_str.split(",")]
         else:
             included_regions = list(regions.keys())
 
         # 创建中继组，使用所有合并的地区组作为节点
-        use_merged_groups = self.config.getboolean(
-            "clash", "use_merged_region_groups", fallback=False
-        )
+        use_merged_groups = self.settings.use_merged_groups
         
         proxies = []
+        region_prefixes = self._get_region_prefixes(regions)
         
         if use_merged_groups:
             # 如果使用合并地区组，则中继组包含所有合并的地区组
             for region_name in regions.keys():
                 if region_name in included_regions:
-                    emoji = regions[region_name]["emoji"]
-                    proxies.append(f"{emoji}{region_name}")
+                    proxies.append(region_prefixes[region_name])
         else:
             # 如果不使用合并地区组，则包含所有按提供者分组的地区组
             region_providers_map = self._get_region_providers_config(providers)
             
             for provider_name in providers.keys():
-                for region_name, region_config in regions.items():
+                for region_name in regions:
+                    if region_name not in included_regions:
+                        continue
                     # 检查该提供者是否在region_providers配置中被指定用于此地区
-                    if region_name in region_providers_map and provider_name in region_providers_map[region_name]:
-                        if region_name in included_regions:
-                            emoji = region_config["emoji"]
-                            proxies.append(f"{emoji}{region_name}_{provider_name}")
                     # 如果没有region_providers配置，或者该地区没有配置，则包含所有地区
-                    elif region_name not in region_providers_map and region_name in included_regions:
-                        emoji = region_config["emoji"]
-                        proxies.append(f"{emoji}{region_name}_{provider_name}")
+                    allowed_providers = region_providers_map.get(region_name)
+                    if allowed_providers is None or provider_name in allowed_providers:
+                        proxies.append(region_prefixes[region_name] + "_" + provider_name)
 
         if not proxies:
             logger.warning("中继组没有可用的节点，跳过生成")
@@ -570,10 +762,11 @@ class ClashConfigGenerator:
 
         # 检查是否有为中继组配置默认节点
         proxy_defaults = {}
-        if self.config.has_section("proxy_group_defaults"):
-            for group_name, default_node in self.config["proxy_group_defaults"].items():
-                if default_node:
-                    proxy_defaults[group_name] = default_node
+        for group_name, default_node in self.sections.get(
+            "proxy_group_defaults", {}
+        ).items():
+            if default_node:
+                proxy_defaults[group_name] = default_node
 
         # 创建中继组配置
         relay_group_config = {
@@ -587,9 +780,8 @@ class ClashConfigGenerator:
         if relay_name in proxy_defaults:
             default_node = proxy_defaults[relay_name]
             if default_node in proxies:
-                # 将默认节点移到列表开头
-                proxies.remove(default_node)
-                proxies.insert(0, default_node)
+                # 将默认节点移到列表开头（一次遍历重建列表）
+                proxies = [default_node] + [p for p in proxies if p != default_node]
                 relay_group_config["proxies"] = proxies
                 logger.info(f"为中继组 {relay_name} 设置默认节点: {default_node}")
             else:
@@ -615,9 +807,9 @@ class ClashConfigGenerator:
         """判断是否应该将中继组添加到当前主代理组"""
         include_relay = True  # 默认添加到所有主代理组
         
-        if self.config.has_section("relay_groups_targets"):
+        if "relay_groups_targets" in self.sections:
             # 如果配置了目标组列表，则只在指定的组中添加中继组
-            target_groups_str = self.config.get("relay_groups_targets", group_name, fallback="")
+            target_groups_str = self._get_option("relay_groups_targets", group_name, "")
             if target_groups_str:
                 include_relay = True
             else:
@@ -631,39 +823,46 @@ class ClashConfigGenerator:
         regions: Dict[str, Dict[str, Any]],
         custom_groups: List[Dict[str, Any]] = None,
         manual_select_group: Optional[Dict[str, Any]] = None,
+        target_groups_by_name: Optional[Dict[str, List[str]]] = None,
     ) -> List[Dict[str, Any]]:
         """生成主要代理组"""
         if custom_groups is None:
             custom_groups = []
+        if target_groups_by_name is None:
+            target_groups_by_name = {}
 
         # 检查是否使用合并的地区组
-        use_merged_groups = self.config.getboolean(
-            "clash", "use_merged_region_groups", fallback=False
-        )
+        use_merged_groups = self.settings.use_merged_groups
 
         # 获取所有地区组名称
         region_group_names = self._get_region_group_names(providers, regions, use_merged_groups)
+        region_prefixes = self._get_region_prefixes(regions)
+
+        # 手动选择组名称（未启用时为 None），循环中不再重复判断
+        manual_select_name = manual_select_group["name"] if manual_select_group else None
 
         # 获取代理组默认配置
         proxy_defaults = {}
-        if self.config.has_section("proxy_group_defaults"):
-            for group_name, default_node in self.config["proxy_group_defaults"].items():
-                if default_node:
-                    proxy_defaults[group_name] = default_node
-                    logger.info(f"读取默认节点配置: {group_name} -> {default_node}")
+        for group_name, default_node in self.sections.get(
+            "proxy_group_defaults", {}
+        ).items():
+            if default_node:
+                proxy_defaults[group_name] = default_node
+                logger.info(f"读取默认节点配置: {group_name} -> {default_node}")
 
         # 获取主代理组的自定义地区配置
         custom_region_groups = {}
-        if self.config.has_section("main_proxy_region_groups"):
-            for group_name, regions_str in self.config["main_proxy_region_groups"].items():
-                region_list = [r.strip() for r in regions_str.split(",")]
-                custom_region_groups[group_name] = region_list
-                logger.info(f"设置 {group_name} 的自定义地区组: {region_list}")
+        for group_name, regions_str in self.sections.get(
+            "main_proxy_region_groups", {}
+        ).items():
+            region_list = [r.strip() for r in regions_str.split(",")]
+            custom_region_groups[group_name] = region_list
+            logger.info(f"设置 {group_name} 的自定义地区组: {region_list}")
 
         # 获取中继组名称（如果配置了）
         relay_group_name = None
-        if self.config.has_section("relay_groups"):
-            relay_group_name = self.config.get("relay_groups", "name", fallback="统一代理")
+        if "relay_groups" in self.sections:
+            relay_group_name = self._get_option("relay_groups", "name", "统一代理")
 
         # 从配置文件获取代理组配置
         proxy_groups_config = self.rules_config.get("proxy_groups", {})
@@ -676,11 +875,19 @@ class ClashConfigGenerator:
 
             # 构建 proxies 列表：默认节点（如果有） + 地区组 + 自定义组 + 中继组 + 手动选择组 + DIRECT
             proxies = []
+            seen = set()  # 与 proxies 同步，用于 O(1) 去重
             default_node = proxy_defaults.get(group_name, None)
 
+            def add(proxy_name):
+                # 跳过默认节点（已在开头）和已添加的节点
+                if proxy_name not in seen and proxy_name != default_node:
+                    proxies.append(proxy_name)
+                    seen.add(proxy_name)
+
             # 添加默认节点（如果配置了）
             if default_node:
                 proxies.append(default_node)
+                seen.add(default_node)
 
             # 根据自定义配置或默认行为添加地区组
             if group_name in custom_region_groups:
@@ -691,46 +898,38 @@ class ClashConfigGenerator:
                     logger.info(f"主代理组 {group_name} 设置为手动模式，不自动添加任何地区节点")
                 else:
                     # 使用自定义地区组
-                    for region_name, region_config in regions.items():
-                        emoji = region_config["emoji"]
-                        full_region_name = f"{emoji}{region_name}"
-                        
-                        # 检查该地区是否在自定义列表中，且不是默认节点
-                        if region_name in region_list and full_region_name != default_node:
-                            proxies.append(full_region_name)
+                    for region_name in regions:
+                        # 检查该地区是否在自定义列表中
+                        if region_name in region_list:
+                            add(region_prefixes[region_name])
             else:
-                # 默认行为：添加所有地区组（排除已作为默认节点的）
+                # 默认行为：添加所有地区组
                 for region_name in region_group_names:
-                    if region_name != default_node:
-                        proxies.append(region_name)
+                    add(region_name)
 
-            # 添加自定义组（根据目标组过滤，排除已作为默认节点的）
+            # 添加自定义组（根据目标组过滤）
             for custom_group in custom_groups:
-                custom_group_name = custom_group["name"]
-                target_groups = custom_group.get("_target_groups", [])
+                target_groups = target_groups_by_name.get(custom_group["name"], [])
 
                 # 如果目标组为空（表示添加到所有主代理组）或包含当前组
-                if (
-                    not target_groups or group_name in target_groups
-                ) and custom_group_name != default_node:
-                    proxies.append(custom_group_name)
+                if not target_groups or group_name in target_groups:
+                    add(custom_group["name"])
 
             # 检查当前主代理组是否将中继组作为默认节点
-            if default_node == relay_group_name and relay_group_name not in proxies:
+            if default_node == relay_group_name and relay_group_name not in seen:
                 proxies.insert(0, relay_group_name)  # 插入到开头以确保是默认节点
+                seen.add(relay_group_name)
 
-            # 添加中继组（如果配置了且不是默认节点，并且不在proxies中）
-            if relay_group_name and relay_group_name != default_node and relay_group_name not in proxies:
-                if self._should_include_relay_group(group_name):
-                    proxies.append(relay_group_name)
+            # 添加中继组（如果配置了）
+            if relay_group_name and self._should_include_relay_group(group_name):
+                add(relay_group_name)
 
-            # 添加手动选择组（如果启用，排除已作为默认节点的，并且不在proxies中）
-            if manual_select_group and manual_select_group["name"] != default_node and manual_select_group["name"] not in proxies:
-                proxies.append(manual_select_group["name"])
+            # 添加手动选择组（如果启用）
+            if manual_select_name:
+                add(manual_select_name)
 
             # 最后添加 DIRECT
-            if "DIRECT" != default_node and "DIRECT" not in proxies:
-                proxies.append("DIRECT")
+            add("DIRECT")
 
             group = {
                 "name": group_name,
@@ -752,11 +951,15 @@ class ClashConfigGenerator:
         return main_groups
 
     def get_rule_providers(self) -> Dict[str, Any]:
-        """获取规则集配置"""
-        return self.rules_config.get("rule-providers", {})
+        """获取规则集配置（返回其浅拷贝）"""
+        return dict(self._rule_providers)
 
     def get_custom_rules(self) -> List[str]:
-        """获取自定义规则"""
+        """获取自定义规则（加载规则文件时已展开，返回其浅拷贝）"""
+        return list(self._custom_rules)
+
+    def _build_custom_rules(self) -> List[str]:
+        """展开规则配置中的自定义规则和规则集引用规则"""
         rules = []
 
         # 获取自定义规则配置
@@ -782,16 +985,17 @@ class ClashConfigGenerator:
     ) -> List[Dict[str, Any]]:
         """根据配置生成所有代理组"""
         # 检查是否使用合并的地区组
-        use_merged_groups = self.config.getboolean(
-            "clash", "use_merged_region_groups", fallback=False
-        )
+        use_merged_groups = self.settings.use_merged_groups
 
         # 先生成中继组，放在最前面
         relay_groups = self.generate_relay_group(providers, regions)
 
         # 生成自定义组和手动选择组
-        custom_groups = self.generate_custom_groups(providers, regions)
+        custom_groups, target_groups_by_name = self.generate_custom_groups(
+            providers, regions
+        )
         manual_select_group = self.generate_manual_select_group(providers)
+        manual_select_groups = (manual_select_group,) if manual_select_group else ()
 
         # 生成地区组
         if use_merged_groups:
@@ -801,47 +1005,52 @@ class ClashConfigGenerator:
 
         # 生成主代理组时传入自定义组和手动选择组，以便添加到选项列表
         main_groups = self.generate_main_proxy_groups(
-            providers, regions, custom_groups, manual_select_group
+            providers,
+            regions,
+            custom_groups,
+            manual_select_group,
+            target_groups_by_name,
         )
 
         # 生成所有代理组 - 按顺序添加：中继组、主代理组、地区组、自定义组、手动选择组
-        all_groups = []
-        if relay_groups:
-            all_groups.extend(relay_groups)
-        all_groups.extend(main_groups)
-        all_groups.extend(region_groups)
-        all_groups.extend([
-            # 添加自定义组，移除内部使用的 _target_groups 字段
-            {k: v for k, v in custom_group.items() if not k.startswith("_")}
-            for custom_group in custom_groups
-        ])
-        if manual_select_group:
-            all_groups.append(manual_select_group)
+        # 一次性构建列表，避免多次 extend 造成的重复扩容
+        all_groups = list(
+            itertools.chain(
+                relay_groups,
+                main_groups,
+                region_groups,
+                custom_groups,
+                manual_select_groups,
+            )
+        )
 
         return all_groups
 
-    def generate_config(self) -> Dict[str, Any]:
-        """生成完整的 Clash 配置"""
+    def generate_config(self) -> Optional[ClashConfig]:
+        """生成完整的 Clash 配置，没有代理提供者时返回 None"""
         providers = self.get_proxy_providers()
         regions = self.get_regions()
 
         if not providers:
             logger.error("没有配置代理提供者")
-            return {}
+            return None
+
+        # 名称列表只在输出 INFO 日志时才构造
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"找到 {len(providers)} 个代理提供者: {list(providers)}")
+            logger.info(f"找到 {len(regions)} 个地区配置: {list(regions)}")
 
-        logger.info(f"找到 {len(providers)} 个代理提供者: {list(providers.keys())}")
-        logger.info(f"找到 {len(regions)} 个地区配置: {list(regions.keys())}")
+        # [clash] 基础配置只取一次，按需转换类型
+        clash = self.sections.get("clash", {})
 
         # 生成配置
-        config = {
-            "port": self.config.getint("clash", "port", fallback=7890),
-            "socks-port": self.config.getint("clash", "socks_port", fallback=7891),
-            "allow-lan": self.config.getboolean("clash", "allow_lan", fallback=True),
-            "mode": self.config.get("clash", "mode", fallback="Rule"),
-            "log-level": self.config.get("clash", "log_level", fallback="info"),
-            "external-controller": self.config.get(
-                "clash", "external_controller", fallback=":9090"
-            ),
+        config: ClashConfig = {
+            "port": int(clash.get("port", 7890)),
+            "socks-port": int(clash.get("socks_port", 7891)),
+            "allow-lan": self._get_bool_option("clash", "allow_lan", True),
+            "mode": clash.get("mode", "Rule"),
+            "log-level": clash.get("log_level", "info"),
+            "external-controller": clash.get("external_controller", ":9090"),
             "proxy-providers": self.generate_proxy_providers_config(providers),
             "proxy-groups": self._generate_all_proxy_groups(providers, regions),
             "rule-providers": self.get_rule_providers(),
@@ -851,24 +1060,65 @@ class ClashConfigGenerator:
         return config
 
     def save_config(
-        self, config: Dict[str, Any], output_file: str = "output/clash_profile.yaml"
+        self, config: ClashConfig, output_file: str = "output/clash_profile.yaml"
     ):
         """保存配置到文件"""
         try:
-            with open(output_file, "w", encoding="utf-8") as f:
-                yaml.dump(
-                    config,
-                    f,
-                    default_flow_style=False,
-                    allow_unicode=True,
-                    sort_keys=False,
-                )
+            # 确保输出目录存在
+            Path(output_file).parent.mkdir(parents=True, exist_ok=True)
 
-            file_size = Path(output_file).stat().st_size
-            logger.info(f"✅ 配置文件已生成: {output_file}")
-            logger.info(f"📊 文件大小: {file_size} 字节")
-            logger.info(f"📊 代理组数量: {len(config.get('proxy-groups', []))}")
-            logger.info(f"📊 规则数量: {len(config.get('rules', []))}")
+            # 优先使用针对 Clash 配置结构的快速输出，不支持时回退到 yaml.dump
+            content = _fast_yaml_dump(config)
+            if content is None:
+                content = _yaml_dump(config)
+
+            payload = content.encode("utf-8")
+
+            if _file_content_equals(output_file, payload):
+                # 内容与现有文件相同，跳过写入，只更新修改时间
+                # （/status 接口以修改时间作为配置的更新时间）
+                os.utime(output_file)
+                status = f"✅ 配置文件内容未变化，跳过写入: {output_file}"
+            else:
+                # 先写入同目录下的临时文件再替换，中途失败不会留下不完整的配置文件
+                # 临时文件名唯一，多个生成进程同时运行时互不干扰
+                output_path = Path(output_file)
+                fd, tmp_file = tempfile.mkstemp(
+                    dir=output_path.parent,
+                    prefix=f".{output_path.name}.",
+                    suffix=".tmp",
+                )
+                try:
+                    try:
+                        # 整个文件内容一次写入，常规文件通常一次 write 即可写完
+                        view = memoryview(payload)
+                        while view:
+                            view = view[os.write(fd, view):]
+                    finally:
+                        os.close(fd)
+                    # mkstemp 创建的文件权限为 0600，改为与直接写入时相同的权限
+                    os.chmod(tmp_file, _output_file_mode(output_file))
+                    os.replace(tmp_file, output_file)
+                except BaseException:
+                    try:
+                        os.remove(tmp_file)
+                    except FileNotFoundError:
+                        pass
+                    raise
+                status = f"✅ 配置文件已生成: {output_file}"
+
+            file_size = len(payload)
+            # 汇总信息合并为一条日志输出
+            logger.info(
+                "\n".join(
+                    [
+                        status,
+                        f"📊 文件大小: {file_size} 字节",
+                        f"📊 代理组数量: {len(config.get('proxy-groups', []))}",
+                        f"📊 规则数量: {len(config.get('rules', []))}",
+                    ]
+                )
+            )
 
             return True
         except Exception as e:
@@ -880,8 +1130,7 @@ class ClashConfigGenerator:
         logger.info("🚀 开始生成 Clash 配置")
         logger.info("=" * 50)
 
-        config = self.generate_config()
-        if not config:
+        if (config := self.generate_config()) is None:
             logger.error("❌ 配置生成失败")
             return False
 